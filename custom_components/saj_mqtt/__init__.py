@@ -7,8 +7,8 @@ from datetime import timedelta
 import voluptuous as vol
 
 from homeassistant.components import mqtt
-from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP, Platform
+from homeassistant.core import Event, HomeAssistant
 from homeassistant.helpers import discovery
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.typing import ConfigType
@@ -146,6 +146,12 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     await saj_mqtt.initialize()
     hass.data[DOMAIN][DATA_SAJMQTT] = saj_mqtt
 
+    # Unsubscribe from the mqtt topics when home assistant stops
+    async def async_stop_saj_mqtt(event: Event) -> None:
+        await saj_mqtt.deinitialize()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop_saj_mqtt)
+
     # Setup coordinators
     LOGGER.debug("Setting up coordinators")
     # Realtime data coordinator
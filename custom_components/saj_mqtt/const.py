@@ -52,7 +52,7 @@ MODBUS_WRITE_REQUEST = 0x06
 MODBUS_REG_APP_MODE = 0x3247
 
 # Saj mqtt constants
-SAJ_MQTT_QOS = 2
+SAJ_MQTT_QOS = 1  # requests are matched by request id, duplicates are ignored
 SAJ_MQTT_RETAIN = False
 SAJ_MQTT_ENCODING = None
 SAJ_MQTT_DATA_TRANSMISSION = "data_transmission"
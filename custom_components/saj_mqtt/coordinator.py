@@ -34,7 +34,7 @@ class SajMqttRealtimeDataCoordinator(SajMqttDataCoordinator):
     async def _async_update_data(self) -> bytearray | None:
         """Fetch the realtime data."""
         reg_start = 0x4000
-        reg_count = 0x100  # 256 registers
+        reg_count = 0x100  # 256 registers (512 bytes, energy statistics included)
         LOGGER.debug(
             f"Fetching realtime data at {log_hex(reg_start)}, length: {log_hex(reg_count)}"
         )
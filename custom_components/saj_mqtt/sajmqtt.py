@@ -2,11 +2,9 @@
 from __future__ import annotations
 
 import asyncio
-from collections import OrderedDict
-import contextlib
 from datetime import datetime
-from random import random
-from struct import pack, unpack_from
+from random import getrandbits
+from struct import Struct
 
 from pymodbus.utilities import computeCRC
 
@@ -30,6 +28,14 @@ from .const import (
 )
 from .utils import debug, log_hex
 
+# Precompiled packet structures, see the packet layouts in the SajMqtt methods
+_REQUEST_HEADER = Struct(">HHBBH")  # [LENGTH][REQ_ID][0x58][0xC9][RANDOM]
+_REQUEST_CONTENT = Struct(">BBHH")  # [ADDRESS][REQ_TYPE][REGISTER][COUNT/VALUE]
+_RESPONSE_HEADER = Struct(">HHIH")  # [LENGTH][REQ_ID][TIMESTAMP][REQ_TYPE]
+_RESPONSE_SIZE = Struct(">B")
+_RESPONSE_WRITE = Struct(">HHH")  # [REGISTER][VALUE][CRC]
+_CRC = Struct(">H")
+
 
 class SajMqtt:
     """SAJ MQTT inverter client instance."""
@@ -51,8 +57,8 @@ class SajMqtt:
             f"saj/{self.serial_number}/{SAJ_MQTT_DATA_TRANSMISSION_RSP}"
         )
 
-        self.read_responses = OrderedDict()
-        self.write_responses = OrderedDict()
+        # Pending requests, the response is set on the future of its request id
+        self.pending_requests: dict[int, asyncio.Future] = {}
 
         self.unsubscribe_callbacks = {}
 
@@ -63,10 +69,12 @@ class SajMqtt:
     async def deinitialize(self) -> None:
         """Deinitialize.
 
-        Currently not used, as we set up via async_setup_platform(), which doesn't support unloading
+        Called when Home Assistant stops, as we set up via async_setup_platform(), which doesn't support unloading
         """
+        # The unsubscribe callbacks returned by mqtt.async_subscribe() are not async
         for unsubscribe_callback in self.unsubscribe_callbacks.values():
-            await unsubscribe_callback()
+            unsubscribe_callback()
+        self.unsubscribe_callbacks = {}
 
     async def read_registers(
         self,
@@ -86,54 +94,49 @@ class SajMqtt:
         )
 
         # Create the MQTT data_transmission packets to send to the inverter
+        # Register each request immediately, so its request id cannot be reused
         packets: list[tuple[bytes, int]] = []
+        futures: dict[int, asyncio.Future] = {}
         while register_count > 0:
             reg_count = min(register_count, MODBUS_MAX_REGISTERS_PER_QUERY)
-            packet = self._create_mqtt_read_packet(register_start, reg_count)
-            packets.append(packet)
+            packet, req_id = self._create_mqtt_read_packet(register_start, reg_count)
+            packets.append((packet, req_id))
+            futures[req_id] = self.hass.loop.create_future()
+            self.pending_requests[req_id] = futures[req_id]
             register_start += reg_count
             register_count -= reg_count
         try:
             async with asyncio.timeout(timeout):
-                # Publish the packets
-                req_ids = []
-                for packet, req_id in packets:
-                    req_ids.append(req_id)
-                    self.read_responses[req_id] = None
-                    debug(
-                        f"Publishing packet with request id: {f'{log_hex(req_id)}'}",
-                        self.debug_mqtt,
-                    )
-                    await self.mqtt.async_publish(
-                        self.hass,
-                        self.topic_data_transmission,
-                        packet,
-                        qos=SAJ_MQTT_QOS,
-                        retain=SAJ_MQTT_RETAIN,
-                        encoding=SAJ_MQTT_ENCODING,
+                # Publish the packets (all at once, instead of one after the other)
+                debug(
+                    f"Publishing packets with request id: {[f'{log_hex(k)}' for k in futures]}",
+                    self.debug_mqtt,
+                )
+                await asyncio.gather(
+                    *(
+                        self.mqtt.async_publish(
+                            self.hass,
+                            self.topic_data_transmission,
+                            packet,
+                            qos=SAJ_MQTT_QOS,
+                            retain=SAJ_MQTT_RETAIN,
+                            encoding=SAJ_MQTT_ENCODING,
+                        )
+                        for packet, _ in packets
                     )
+                )
                 debug("All packets published", self.debug_mqtt)
 
                 # Wait for the answer packets
-                while True:
-                    responses = OrderedDict(
-                        (k, self.read_responses[k])
-                        for k in req_ids
-                        if k in self.read_responses
-                    )
-                    if all(responses.values()) is True:
-                        break
-                    debug(
-                        f"Waiting for responses with request id: {[f'{log_hex(k)}' for k in req_ids if responses[k] is None]}",
-                        self.debug_mqtt,
-                    )
-                    await asyncio.sleep(1)
+                debug(
+                    f"Waiting for responses with request id: {[f'{log_hex(k)}' for k in futures]}",
+                    self.debug_mqtt,
+                )
+                responses = await asyncio.gather(*futures.values())
                 debug("All responses received", self.debug_mqtt)
 
                 # Concatenate the payloads, so we get the full answer
-                data = bytearray()
-                for response in responses.values():
-                    data += response
+                data = bytearray().join(responses)
 
         except asyncio.TimeoutError:
             LOGGER.warning(
@@ -145,11 +148,10 @@ class SajMqtt:
                 f"Could not publish {SAJ_MQTT_DATA_TRANSMISSION} packets, reason: {ex}"
             )
             data = None
-
-        # Remove req_ids from self.read_responses
-        for req_id in req_ids:
-            with contextlib.suppress(KeyError):
-                del self.read_responses[req_id]
+        finally:
+            # Remove request ids generated in this method from self.pending_requests
+            for req_id in futures:
+                self.pending_requests.pop(req_id, None)
 
         return data
 
@@ -164,10 +166,11 @@ class SajMqtt:
 
         # Create the MQTT data_transmission packet to send to the inverter
         packet, req_id = self._create_mqtt_write_packet(register, value)
+        future = self.hass.loop.create_future()
+        self.pending_requests[req_id] = future
         try:
             async with asyncio.timeout(timeout):
                 # Publish packet
-                self.write_responses[req_id] = None
                 debug(
                     f"Publishing packet with request id: {f'{log_hex(req_id)}'}",
                     self.debug_mqtt,
@@ -181,20 +184,14 @@ class SajMqtt:
                     encoding=SAJ_MQTT_ENCODING,
                 )
 
-                # Wait for the answer packet (check if not None, as we can also get 0 as response)
-                while True:
-                    if self.write_responses[req_id] is not None:
-                        break
-                    debug(
-                        f"Waiting for response with request id: {f'{log_hex(req_id)}' if self.write_responses[req_id] is None else ''}",
-                        self.debug_mqtt,
-                    )
-                    await asyncio.sleep(1)
+                # Wait for the answer packet
+                debug(
+                    f"Waiting for response with request id: {f'{log_hex(req_id)}'}",
+                    self.debug_mqtt,
+                )
+                data = await future
                 debug("Response received", self.debug_mqtt)
 
-                # Get the answer
-                data = self.write_responses[req_id]
-
         except asyncio.TimeoutError:
             LOGGER.warning(
                 "Timeout error: the inverter did not answer in expected timeout"
@@ -205,10 +202,9 @@ class SajMqtt:
                 f"Could not publish {SAJ_MQTT_DATA_TRANSMISSION} packets, reason: {ex}"
             )
             data = None
-
-        # Cleanup self.write_responses from request id generated in this method
-        with contextlib.suppress(KeyError):
-            del self.write_responses[req_id]
+        finally:
+            # Remove request id generated in this method from self.pending_requests
+            self.pending_requests.pop(req_id, None)
 
         return data
 
@@ -242,16 +238,16 @@ class SajMqtt:
         try:
             debug(f"Received {SAJ_MQTT_DATA_TRANSMISSION_RSP} packet", self.debug_mqtt)
             req_id, content = self._parse_packet(msg.payload)
-            if req_id in self.read_responses:
-                self.read_responses[req_id] = content
-            if req_id in self.write_responses:
-                self.write_responses[req_id] = content
+            # Ignore responses of unknown, timed out or already answered requests
+            future = self.pending_requests.get(req_id)
+            if future is not None and not future.done():
+                future.set_result(content)
         except Exception as ex:  # pylint: disable=broad-except
             LOGGER.error(
                 f"Error while handling {SAJ_MQTT_DATA_TRANSMISSION_RSP} packet: {ex}"
             )
 
-    def _parse_packet(self, packet) -> tuple[int, bytearray | int]:
+    def _parse_packet(self, packet) -> tuple[int, memoryview | int]:
         """Parse a mqtt packet.
 
         Packet consists of [HEADER][PACKET_DATA]:
@@ -259,16 +255,17 @@ class SajMqtt:
         - [PACKET_DATA] see specific packet parsing
         """
         # Parse the header
-        length, req_id, timestamp, req_type = unpack_from(">HHIH", packet, 0x00)
+        length, req_id, timestamp, req_type = _RESPONSE_HEADER.unpack_from(packet, 0x00)
         req_type -= (
             0x100  # substract 0x100 to match the request type (modbus read or write)
         )
-        date = datetime.fromtimestamp(timestamp)
 
-        debug(f"Request id: {log_hex(req_id)}", self.debug_mqtt)
-        debug(f"Request type: {log_hex(req_type)}", self.debug_mqtt)
-        debug(f"Length: {length} bytes", self.debug_mqtt)
-        debug(f"Timestamp: {date}", self.debug_mqtt)
+        # Only format the header details when mqtt debugging is enabled
+        if self.debug_mqtt:
+            debug(f"Request id: {log_hex(req_id)}")
+            debug(f"Request type: {log_hex(req_type)}")
+            debug(f"Length: {length} bytes")
+            debug(f"Timestamp: {datetime.fromtimestamp(timestamp)}")
 
         if req_type == MODBUS_READ_REQUEST:
             content = self._parse_read_packet(packet)
@@ -279,7 +276,7 @@ class SajMqtt:
 
         return req_id, content
 
-    def _parse_read_packet(self, packet) -> bytearray:
+    def _parse_read_packet(self, packet) -> memoryview:
         """Parse a mqtt read packet.
 
         Packet consists of [SIZE][CONTENT][CRC]:
@@ -288,28 +285,27 @@ class SajMqtt:
         - [CRC] checksum
         """
         # Get the size of the content
-        (size,) = unpack_from(">B", packet, 0xA)
+        (size,) = _RESPONSE_SIZE.unpack_from(packet, 0xA)
 
-        # Get the content
-        content = packet[0xB : 0xB + size]
+        # Get the content (as a view on the packet, to avoid copying it)
+        packet_view = memoryview(packet)
+        content = packet_view[0xB : 0xB + size]
 
         # Get the CRC
-        (crc16,) = unpack_from(">H", packet, 0xB + size)
+        (crc16,) = _CRC.unpack_from(packet, 0xB + size)
 
         # CRC is calculated starting from "request" at offset 0x3a
-        calc_crc = computeCRC(packet[0x8 : 0xB + size])
+        calc_crc = computeCRC(packet_view[0x8 : 0xB + size])
 
-        debug(f"Response length: {size} bytes", self.debug_mqtt)
-        debug(
-            f"Response bytes: {':'.join(f'{b:02x}' for b in content)}", self.debug_mqtt
-        )
-        debug(
-            f"CRC16: {log_hex(crc16)} -> {'ok' if crc16 == calc_crc else 'bad'}",
-            self.debug_mqtt,
-        )
+        if self.debug_mqtt:
+            debug(f"Response length: {size} bytes")
+            debug(f"Response bytes: {content.hex(':')}")
+            debug(
+                f"CRC16: {log_hex(crc16)} -> {'ok' if crc16 == calc_crc else 'bad'}"
+            )
 
         if crc16 != calc_crc:
-            raise ValueError("Invalid CRC: expected {calc_crc}, received {crc16}")
+            raise ValueError(f"Invalid CRC: expected {calc_crc}, received {crc16}")
 
         return content
 
@@ -321,23 +317,23 @@ class SajMqtt:
         - [VALUE] written to the register
         - [CRC] checksum
         """
-        register, value, orig_crc16 = unpack_from(">HHH", packet, 0xA)
+        register, value, orig_crc16 = _RESPONSE_WRITE.unpack_from(packet, 0xA)
 
         # Get the CRC
-        (crc16,) = unpack_from(">H", packet, 0xE)
+        (crc16,) = _CRC.unpack_from(packet, 0xE)
 
         # CRC is calculated starting from "request" at offset 0x3a
         calc_crc = computeCRC(packet[0x8:0xE])
 
-        debug(f"Written register: {log_hex(register)}", self.debug_mqtt)
-        debug(f"Written value: {log_hex(value)}", self.debug_mqtt)
-        debug(
-            f"CRC16: {log_hex(crc16)} -> {'ok' if crc16 == calc_crc else 'bad'}",
-            self.debug_mqtt,
-        )
+        if self.debug_mqtt:
+            debug(f"Written register: {log_hex(register)}")
+            debug(f"Written value: {log_hex(value)}")
+            debug(
+                f"CRC16: {log_hex(crc16)} -> {'ok' if crc16 == calc_crc else 'bad'}"
+            )
 
         if crc16 != calc_crc:
-            raise ValueError("Invalid CRC: expected {calc_crc}, received {crc16}")
+            raise ValueError(f"Invalid CRC: expected {calc_crc}, received {crc16}")
 
         return value
 
@@ -353,8 +349,8 @@ class SajMqtt:
         - [CRC] checksum
         """
         debug("Creating mqtt read packet", self.debug_mqtt)
-        content = pack(
-            ">BBHH", MODBUS_DEVICE_ADDRESS, MODBUS_READ_REQUEST, start, count
+        content = _REQUEST_CONTENT.pack(
+            MODBUS_DEVICE_ADDRESS, MODBUS_READ_REQUEST, start, count
         )
 
         return self._create_modbus_mqtt_packet(MODBUS_READ_REQUEST, content)
@@ -371,8 +367,8 @@ class SajMqtt:
         - [CRC] checksum
         """
         debug("Creating mqtt write packet", self.debug_mqtt)
-        content = pack(
-            ">BBHH", MODBUS_DEVICE_ADDRESS, MODBUS_WRITE_REQUEST, register, value
+        content = _REQUEST_CONTENT.pack(
+            MODBUS_DEVICE_ADDRESS, MODBUS_WRITE_REQUEST, register, value
         )
 
         return self._create_modbus_mqtt_packet(MODBUS_WRITE_REQUEST, content)
@@ -388,16 +384,23 @@ class SajMqtt:
         crc16 = computeCRC(content)
 
         # Assemble the modbus content into the mqtt packet framework
-        req_id = int(random() * 65536)
-        rand = int(random() * 65536)
-        packet = pack(">HBBH", req_id, 0x58, 0xC9, rand) + content + pack(">H", crc16)
-
-        debug(f"Request id: {log_hex(req_id)}", self.debug_mqtt)
-        debug(f"Request type: {log_hex(req_type)}", self.debug_mqtt)
-        debug(f"CRC16: {log_hex(crc16)}", self.debug_mqtt)
-        debug(f"Request length: {len(packet)} bytes", self.debug_mqtt)
-        debug(f"Request bytes: {':'.join(f'{b:02x}' for b in packet)}", self.debug_mqtt)
-
-        packet = pack(">H", len(packet)) + packet
-
-        return packet, req_id
+        # The packet is built in place, the length excludes the length field itself
+        # Make sure the request id is not used by another pending request
+        rand32 = getrandbits(32)
+        req_id, rand = rand32 >> 16, rand32 & 0xFFFF
+        while req_id in self.pending_requests:
+            req_id = getrandbits(16)
+        length = _REQUEST_HEADER.size - 2 + len(content) + _CRC.size
+        packet = bytearray(length + 2)
+        _REQUEST_HEADER.pack_into(packet, 0, length, req_id, 0x58, 0xC9, rand)
+        packet[_REQUEST_HEADER.size : length] = content
+        _CRC.pack_into(packet, length, crc16)
+
+        if self.debug_mqtt:
+            debug(f"Request id: {log_hex(req_id)}")
+            debug(f"Request type: {log_hex(req_type)}")
+            debug(f"CRC16: {log_hex(crc16)}")
+            debug(f"Request length: {length} bytes")
+            debug(f"Request bytes: {packet[2:].hex(':')}")
+
+        return bytes(packet), req_id
@@ -1,7 +1,8 @@
 """Support for SAJ MQTT sensors."""
 from __future__ import annotations
 
-from struct import unpack_from
+import logging
+from struct import Struct
 
 from homeassistant.components.sensor import (
     SensorDeviceClass,
@@ -340,6 +341,18 @@ async def async_setup_platform(
 class SajMqttSensor(CoordinatorEntity[SajMqttDataCoordinator], SensorEntity):
     """Saj mqtt sensor."""
 
+    # Sensor specific attributes (entity _attr_* attributes use the base __dict__)
+    __slots__ = (
+        "offset",
+        "str_length",
+        "unpack_from",
+        "scale",
+        "precision",
+        "format_value",
+        "enum_names",
+        "last_available",
+    )
+
     def __init__(
         self,
         coordinator: SajMqttDataCoordinator,
@@ -359,13 +372,28 @@ class SajMqttSensor(CoordinatorEntity[SajMqttDataCoordinator], SensorEntity):
             enabled_default,
         ) = config_tuple
 
-        self.data_type: str = data_type
         self.offset: int = offset
-        self.scale: float | str | None = scale
-        self.unit: str | None = unit
+        # Get string length once (>Sxx is custom type to indicate a string of length xx)
+        self.str_length: int | None = (
+            int(data_type.replace(">S", "")) if data_type.startswith(">S") else None
+        )
+        # Precompile the struct format once (not applicable for strings)
+        self.unpack_from = (
+            Struct(data_type).unpack_from if self.str_length is None else None
+        )
+        # Precompute the scale factor and its precision (scale should ALWAYS contain a .)
+        self.scale: float | None = float(scale) if scale is not None else None
+        self.precision: int = (
+            max(0, str(scale)[::-1].find(".")) if scale is not None else 0
+        )
+        # If scale is a str, the value is formatted with the same precision
+        self.format_value: bool = isinstance(scale, str)
         # Use state class as enum class when device class is ENUM
-        self.enum_class = (
-            state_class if device_class is SensorDeviceClass.ENUM else None
+        # and build the lookup table from enum value to enum name once
+        self.enum_names: dict[int, str] | None = (
+            {e.value: e.name for e in state_class}
+            if device_class is SensorDeviceClass.ENUM
+            else None
         )
 
         # Set entity attributes
@@ -379,12 +407,14 @@ class SajMqttSensor(CoordinatorEntity[SajMqttDataCoordinator], SensorEntity):
         self._attr_native_unit_of_measurement = unit
         # Set options as enum names when device class is ENUM
         self._attr_options = (
-            [e.name for e in self.enum_class] if self.enum_class else None
+            list(self.enum_names.values()) if self.enum_names else None
         )
         self._attr_entity_registry_enabled_default = enabled_default
         # Set entity value
-        LOGGER.debug(f"Setting up sensor: {self.name}")
+        LOGGER.debug(f"Setting up sensor: {self._attr_name}")
         self._attr_native_value = self._get_native_value()
+        # Availability of the last written state (None until a state is written)
+        self.last_available: bool | None = None
 
         # Set device info
         self._attr_device_info = device_info
@@ -396,29 +426,31 @@ class SajMqttSensor(CoordinatorEntity[SajMqttDataCoordinator], SensorEntity):
         if payload is None:
             return None
 
-        # Get raw sensor value (>Sxx is custom type to indicate a string of length xx)
+        # Get raw sensor value
         value: int | float | str | None = None
-        if self.data_type.startswith(">S"):
-            reg_length = int(self.data_type.replace(">S", ""))
-            value = bytearray.decode(payload[self.offset : self.offset + reg_length])
+        if self.str_length is not None:
+            value = bytearray.decode(
+                payload[self.offset : self.offset + self.str_length]
+            )
         else:
-            (value,) = unpack_from(self.data_type, payload, self.offset)
+            (value,) = self.unpack_from(payload, self.offset)
 
-        # Set sensor value (taking scale into account, scale should ALWAYS contain a .)
+        # Set sensor value (taking scale into account)
         if self.scale is not None:
-            digits = max(0, str(self.scale)[::-1].find("."))
-            value = round(value * float(self.scale), digits)
-            # If scale is a str, format the value with the same precision
-            if isinstance(self.scale, str):
-                value = "{:.{precision}f}".format(value, precision=digits)
+            value = round(value * self.scale, self.precision)
+            if self.format_value:
+                value = "{:.{precision}f}".format(value, precision=self.precision)
 
         # Convert enum sensor to the corresponding enum name
-        if self.enum_class:
-            value = self.enum_class(value).name
-
-        LOGGER.debug(
-            f"Sensor: {self.name}, value: {value}{' ' + self.unit if self.unit else ''}"
-        )
+        if self.enum_names:
+            value = self.enum_names[value]
+
+        # Only build the log message when needed, it runs for every sensor on every update
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            unit = self._attr_native_unit_of_measurement
+            LOGGER.debug(
+                f"Sensor: {self._attr_name}, value: {value}{' ' + unit if unit else ''}"
+            )
 
         return value
 
@@ -429,6 +461,11 @@ class SajMqttSensor(CoordinatorEntity[SajMqttDataCoordinator], SensorEntity):
         if value is None:
             return None
 
-        # Only update sensor when there is a value
+        # Only update sensor when there is a value, and only write the state when
+        # the value or the availability changed since the last update
+        available = self.available
+        if value == self._attr_native_value and available == self.last_available:
+            return None
         self._attr_native_value = value
+        self.last_available = available
         self.async_write_ha_state()
@@ -2,18 +2,26 @@
 # information gathering for saj inverters through data_transmission mqtt topic
 # usage example: ./inf_data_gather.py 192.168.16.1 H1S2602J2119E01121 0x4000 0x100 2>/dev/null | python3 parse_realtime_data.py -p
 
-from collections import OrderedDict
-from struct import pack, unpack_from
+from struct import Struct, unpack_from
 from datetime import datetime
 from time import time, sleep
 from pymodbus.utilities import computeCRC
 from sys import argv, stderr, stdout
-import random
+from random import getrandbits
 import paho.mqtt.client as paho
 
 # Cannot exceed 123 registers (0x7b)
 MAX_REGISTERS_PER_REQUEST = 0x64
 
+# Precompiled structs of the MQTT packet framework
+_HEADER_STRUCT = Struct(">HBBH")
+_CONTENT_STRUCT = Struct(">BBHH")
+_CRC_STRUCT = Struct(">H")
+_LEN_STRUCT = Struct(">H")
+
+# Length prefix, header, modbus content and CRC16
+PACKET_SIZE = _LEN_STRUCT.size + _HEADER_STRUCT.size + _CONTENT_STRUCT.size + _CRC_STRUCT.size
+
 def eprint(*args, **kwargs):
     print(*args, file=stderr, **kwargs)
 
@@ -29,31 +37,42 @@ class SajMqttModbusRead(object):
         self.end = end
         self.address = address
 
-        self.responses = OrderedDict()
+        self.responses = {}
+        self.pending = 0
+
+    @staticmethod
+    def _forge_template() -> bytearray:
+        """
+            Create the MQTT packet buffer shared by all the requests of a query,
+            the length prefix never changes
+        """
+        packet = bytearray(PACKET_SIZE)
+        _LEN_STRUCT.pack_into(packet, 0x0, PACKET_SIZE - _LEN_STRUCT.size)
+
+        return packet
 
     @staticmethod
-    def _forge_packet(register_start: int, register_count: int, address: int):
+    def _forge_packet(packet: bytearray, register_start: int, register_count: int, address: int):
         """
-            Given the start and count registers, forge the MQTT packet for the
-            request to handle that single request
+            Given the start and count registers, forge into the template packet
+            the MQTT request to handle that single request
         """
 
         # Build the modbus content part of the MQTT packet
-        content = pack(">BBHH",  address, SajMqttModbusRead.MODBUS_READ_REQUEST, register_start, register_count)
-        crc16 = computeCRC(content)
+        _CONTENT_STRUCT.pack_into(packet, 0x8, address, SajMqttModbusRead.MODBUS_READ_REQUEST, register_start, register_count)
+        crc16 = computeCRC(memoryview(packet)[0x8:0xe])
 
         # Assemble the modbus content into the MQTT packet framework
-        req_id = int(random.random() * 65536)
-        rnd = int(random.random() * 65536)
+        req_id = getrandbits(16)
+        rnd = getrandbits(16)
 
-        packet = pack(">HBBH", req_id, 0x58, 0xc9, rnd) + content + pack(">H", crc16)
+        _HEADER_STRUCT.pack_into(packet, 0x2, req_id, 0x58, 0xc9, rnd)
+        _CRC_STRUCT.pack_into(packet, 0xe, crc16)
 
         eprint("Request ID: %04x - CRC16: %04x - Random: %04x" % (req_id, crc16, rnd))
-        eprint("Length: %d bytes" % (len(packet),))
-
-        packet = pack(">H", len(packet)) + packet
+        eprint("Length: %d bytes" % (len(packet) - _LEN_STRUCT.size,))
 
-        return packet, req_id
+        return req_id
 
     @staticmethod
     def _parse_packet(packet: bytes):
@@ -61,18 +80,19 @@ class SajMqttModbusRead(object):
 
         date = datetime.fromtimestamp(timestamp)
         size, = unpack_from(">B", packet, 0xa)
-        content = packet[0xb:0xb + size]
+        packet_view = memoryview(packet)
+        content = packet_view[0xb:0xb + size]
         crc16, = unpack_from(">H", packet, 0xb + size)
 
         # CRC is calculated starting from "request" at offset 0x3a
-        calc_crc = computeCRC(packet[0x8:0xb + size])
+        calc_crc = computeCRC(packet_view[0x8:0xb + size])
 
         eprint("Packet length: %d bytes - Request ID: %4x - Request type: %4x" % (length, req_id, request))
         eprint("Timestamp: %s" % (date,))
 
         eprint()
         eprint("Register size: %d" % (size,))
-        eprint("Register content: %s" % (":".join("%02x" % (byte,) for byte in content),))
+        eprint("Register content: %s" % (content.hex(":"),))
         eprint()
         eprint("CRC16: %x: %s" % (crc16, "ok" if crc16 == calc_crc else "bad"))
 
@@ -84,15 +104,25 @@ class SajMqttModbusRead(object):
         """
         start = self.start
         end = self.end
+        address = self.address
         responses = self.responses
+        forge_packet = self._forge_packet
+        publish = client.publish
+
+        # Only the ids, the register range and the CRC change between requests
+        packet = self._forge_template()
 
         while start < end:
 
             length = min(end - start, MAX_REGISTERS_PER_REQUEST)
-            packet, req_id = self._forge_packet(start, length, self.address)
+            req_id = forge_packet(packet, start, length, address)
+
+            # A colliding request id reuses its slot, count it only if already answered
+            if responses.get(req_id, b"") is not None:
+                self.pending += 1
 
             responses[req_id] = None
-            client.publish(topic=topic, payload=packet, qos=2, retain=False)
+            publish(topic, bytes(packet), 2, False)
 
             start += length
 
@@ -103,20 +133,22 @@ class SajMqttModbusRead(object):
         """
         req_id, size, content = self._parse_packet(payload)
 
-        if req_id not in self.responses:
+        responses = self.responses
+
+        if req_id not in responses:
             return
 
-        self.responses[req_id] = content
+        if responses[req_id] is None:
+            self.pending -= 1
+
+        responses[req_id] = content
 
     def get_response(self) -> bytes|None:
         if not self.is_done():
             return None
 
-        data = bytearray()
-        for req_id, response in self.responses.items():
-            data += response
-
-        return data
+        # join() sizes the buffer once and copies each response into it
+        return bytearray().join(self.responses.values())
 
     def is_done(self):
         """
@@ -126,7 +158,7 @@ class SajMqttModbusRead(object):
         if not self.responses:
             return False
 
-        return all((response for req_id, response in self.responses.items()))
+        return self.pending == 0
 
 
 class SajMqttModbusWrite(object):
@@ -148,22 +180,23 @@ class SajMqttModbusWrite(object):
             to do so.
         """
 
-        # Build the modbus content part of the MQTT packet
-        content = pack(">BBHH", address, SajMqttModbusWrite.MODBUS_WRITE_REQUEST, register, value)
-        crc16 = computeCRC(content)
+        # Build the modbus content part of the MQTT packet, right after the length prefix
+        packet = bytearray(PACKET_SIZE)
+        _LEN_STRUCT.pack_into(packet, 0x0, PACKET_SIZE - _LEN_STRUCT.size)
+        _CONTENT_STRUCT.pack_into(packet, 0x8, address, SajMqttModbusWrite.MODBUS_WRITE_REQUEST, register, value)
+        crc16 = computeCRC(memoryview(packet)[0x8:0xe])
 
         # Assemble the modbus content into the MQTT packet framework
-        req_id = int(random.random() * 65536)
-        rnd = int(random.random() * 65536)
+        req_id = getrandbits(16)
+        rnd = getrandbits(16)
 
-        packet = pack(">HBBH", req_id, 0x58, 0xc9, rnd) + content + pack(">H", crc16)
+        _HEADER_STRUCT.pack_into(packet, 0x2, req_id, 0x58, 0xc9, rnd)
+        _CRC_STRUCT.pack_into(packet, 0xe, crc16)
 
         eprint("Request ID: %04x - CRC16: %04x - Random: %04x" % (req_id, crc16, rnd))
-        eprint("Length: %d bytes" % (len(packet),))
-
-        packet = pack(">H", len(packet)) + packet
+        eprint("Length: %d bytes" % (len(packet) - _LEN_STRUCT.size,))
 
-        return packet, req_id
+        return bytes(packet), req_id
 
     @staticmethod
     def _parse_packet(packet: bytes):
@@ -225,7 +258,7 @@ class SajMqttModbusWrite(object):
 def on_message(client, userdata, message, tmp=None):
 
     eprint("received message - topic: %s - qos: %d - " % (message.topic, message.qos))
-    eprint("message: %s" % (":".join("%02x" % (byte,) for byte in message.payload),))
+    eprint("message: %s" % (message.payload.hex(":"),))
 
     request = userdata
     request.parse_message(message.payload)
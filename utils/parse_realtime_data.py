@@ -1,20 +1,48 @@
-from struct import unpack_from, pack
+from struct import Struct
 from datetime import datetime
-from sys import argv
+from os import read
+from sys import argv, stdout
 import time
 
-filein = open("/dev/stdin", "rb")
-
-data = filein.read(1200)
+# Precompiled structures of the realtime data packet fields
+HEADER = Struct(">II")
+UINT16 = Struct(">H")
+SAMPLE_DATE = Struct(">HBBBBB")
+HEATSINK = Struct(">HxxhxxxxxxHxxxxH")
+# 0086 - 0111: grid, inverter, output, bus, battery and photovoltaic data (gaps are skipped)
+GRID_TO_PV = Struct(">HhHhhhh28xHhHhh20xHhHhhh24xHHHhhhhhH2xHHHHHH")
+DIRECTION = Struct(">HhhH")
+# Direction names, indexed by whether the direction register is non-zero
+PV_DIRECTION = ("ingoing", "outgoing")
+BAT_DIRECTION = ("discharging", "charging")
+GRID_DIRECTION = ("fetching", "putting")
+OUTPUT_DIRECTION = ("ingoing", "outgoing")
+# 0164 - 017f: power summary (gap is skipped)
+POWER_SUMMARY = Struct(">Hh6xHhhhhhHHh")
+# 01a2 - 0221: daily, monthly, yearly and total counters of each energy statistic (gap is skipped)
+ENERGY_STATS = Struct(">12I16x16I")
+
+# Read straight from the stdin descriptor, a pipe may deliver the buffer in pieces
+data = bytearray()
+while len(data) < 1200:
+      chunk = read(0, 1200 - len(data))
+      if not chunk:
+            break
+      data += chunk
+
+data = memoryview(data)
 
 if len(argv) > 1 and argv[1] == "-p":
-      header = pack(">II", 0x0, int(time.time()))
-      data = header + b'\x00'*28 + data
+      # Raw registers start at 0x24: pack the header in place, the gap stays zeroed
+      packet = bytearray(0x24 + len(data))
+      HEADER.pack_into(packet, 0x0, 0x0, int(time.time()))
+      packet[0x24:] = data
+      data = memoryview(packet)
 
-sequence, timestamp = unpack_from(">II", data, 0x0)
+sequence, timestamp = HEADER.unpack_from(data, 0x0)
 date = datetime.fromtimestamp(timestamp)
 
-inverter_type, = unpack_from(">H", data, 0x22)
+inverter_type, = UINT16.unpack_from(data, 0x22)
 
 # 0024 - 2 byte, Anno (eg: 2022 in decimale)
 # 0026 - 1 byte, Mese (eg: in decimale 12)
@@ -22,12 +50,21 @@ inverter_type, = unpack_from(">H", data, 0x22)
 # 0028 - 1 byte, Ora (eg: in decimale 14)
 # 0029 - 1 byte, Minuto (eg: in decimale 50)
 # 002a - 1 byte, Secondo (eg: in decimale 7)
-year, month, day, hour, minute, second = unpack_from(">HBBBBB", data, 0x24)
+year, month, day, hour, minute, second = SAMPLE_DATE.unpack_from(data, 0x24)
 
-inverter_work_mode, = unpack_from(">H", data, 0x2c)
-heatsink_temp, earth_leakage, iso4, conn_time = unpack_from(">HxxhxxxxxxHxxxxH", data, 0x44)
+inverter_work_mode, = UINT16.unpack_from(data, 0x2c)
+heatsink_temp, earth_leakage, iso4, conn_time = HEATSINK.unpack_from(data, 0x44)
 heatsink_temp /= 10
 
+# The blocks from 0x86 up to 0x111 are unpacked at once, the fields are described below
+(rgrid_volt, rgrid_curr, rgrid_freq, rgrid_dci, rgrid_power_watt, rgrid_power_va, rgrid_power_pf,
+ rinv_volt, rinv_current, rinv_freq, rinv_power_watt, rinv_power_va,
+ rout_volt, rout_curr, rout_freq, rout_dvi, rout_power_watt, rout_power_va,
+ bus_volt_master, bus_volt_slave,
+ bat_volt, bat_curr, bat_curr1, bat_curr2, bat_power, bat_tempc, bat_percent,
+ pv1_volt, pv1_curr, pv1_power,
+ pv2_volt, pv2_curr, pv2_power) = GRID_TO_PV.unpack_from(data, 0x86)
+
 # 0086 2 byte, RGridVolt, tensione in decivolt
 # 0088 2 byte, ROutCurr, corrente in centiampere
 # 0090 2 byte, ROutFreq, frequenza in centihz
@@ -35,7 +72,6 @@ heatsink_temp /= 10
 # 0094 2 byte, ROutPowerWatt, potenza attiva W?
 # 0096 2 byte, RGridPowerVA, potenza apparente VA?
 # 0098 2 byte, RGridPowerPF, fattore di correzione di potenza
-rgrid_volt, rgrid_curr, rgrid_freq, rgrid_dci, rgrid_power_watt, rgrid_power_va, rgrid_power_pf = unpack_from(">HhHhhhh", data, 0x86)
 rgrid_volt /= 10
 rgrid_curr /= 100
 rgrid_freq /= 100
@@ -46,7 +82,6 @@ rgrid_power_pf /= 1000
 # 00b4 2 byte, RInvFreq
 # 00b6 2 byte, RInvPowerWatt
 # 00b8 2 byte, RInvPowerVA
-rinv_volt, rinv_current, rinv_freq, rinv_power_watt, rinv_power_va = unpack_from(">HhHhh", data, 0xb0)
 rinv_volt /= 10
 rinv_current /= 100
 rinv_freq /= 100
@@ -58,7 +93,6 @@ rinv_pf = rinv_power_watt / rinv_power_va
 # 00d4 2 byte, ROutDVI (forse è ROutDCI?)
 # 00d6 2 byte, ROutPowerWatt
 # 00d8 2 byte, ROutPowerVA
-rout_volt, rout_curr, rout_freq, rout_dvi, rout_power_watt, rout_power_va = unpack_from(">HhHhhh", data, 0xce)
 rout_volt /= 10
 rout_curr /= 100
 rout_freq /= 100
@@ -66,7 +100,6 @@ rout_pf = rout_power_watt / rout_power_va
 
 # 00f2 2 byte, BusVoltMaster
 # 00f4 2 byte, BusVoltSlave
-bus_volt_master, bus_volt_slave = unpack_from(">HH", data, 0xf2)
 bus_volt_master /= 10
 bus_volt_slave /= 10
 
@@ -77,7 +110,6 @@ bus_volt_slave /= 10
 # 00fe 2 byte, BatPower - potenza batterie (valori da controllare)
 # 0100 2 byte, BatTempC - temperatura batterie (valori da controllare)
 # 0102 2 byte, BatEnergyPercent - energia residua batterie (valori da controllare)
-bat_volt, bat_curr, bat_curr1, bat_curr2, bat_power, bat_tempc, bat_percent = unpack_from(">HhhhhhH", data, 0xf6)
 bat_volt /= 10
 bat_curr /= 100
 bat_curr1 /= 100
@@ -89,14 +121,12 @@ bat_power2 = bat_volt * bat_curr
 # 0106 2 byte - PV1Volt - tensione pannelli array 1
 # 0108 2 byte - PV1Curr - corrente pannelli array 1
 # 010a 2 byte - PVPower - potenza pannelli array 1
-pv1_volt, pv1_curr, pv1_power = unpack_from(">HHH", data, 0x106)
 pv1_volt /= 10
 pv1_curr /= 100
 
 # 010c 2 byte - PV2Volt - tensione pannelli array 2
 # 010f 2 byte - PV2Curr - corrente pannelli array 2
 # 0110 2 byte - PV2Power - potenza pannelli array 2
-pv2_volt, pv2_curr, pv2_power = unpack_from(">HHH", data, 0x10c)
 pv2_volt /= 10
 pv2_curr /= 100
 
@@ -104,11 +134,9 @@ pv2_curr /= 100
 # 0150 2 byte - Battery Direction - direzione flusso batteria, 0 è riceve corrente e 1 è produce corrente)
 # 0152 2 byte - Grid Direction - direzione flusso di rete, 0 riceve corrente, 1 produce corrente)
 # 0154 2 byte - Output Direction - direzione flusso output (non è chiaro il senso, presumibilmente 0 riceve e 1 produce)
-dir_pv, dir_bat, dir_grid, dir_output = unpack_from(">HhhH", data, 0x14e)
-dir_pv = "ingoing" if dir_pv == 0 else "outgoing"
-dir_bat = "discharging" if dir_bat == 0 else "charging"
-dir_grid = "fetching" if dir_grid == 0 else "putting"
-dir_output = "ingoing" if dir_output == 0 else "outgoing"
+dir_pv, dir_bat, dir_grid, dir_output = DIRECTION.unpack_from(data, 0x14e)
+dir_pv, dir_bat, dir_grid, dir_output = (PV_DIRECTION[dir_pv != 0], BAT_DIRECTION[dir_bat != 0],
+      GRID_DIRECTION[dir_grid != 0], OUTPUT_DIRECTION[dir_output != 0])
 
 # 0164 2 byte - SysTotalLoadWatt - Totale della potenza attiva dell'inverter (valore da controllare, riporta 18 Watt, ma può ben essere la potenza del carico)
 # ... buco di 8 byte, riprende a 016e modbus 40a5h
@@ -121,10 +149,10 @@ dir_output = "ingoing" if dir_output == 0 else "outgoing"
 # 017a 2 byte - BackupTotalLoadPowerWatt - carico totale del backup in watt in potenza attiva (dai dati risultano 18 watt)
 # 017c 2 byte - BackupTotalLoadPowerVA - carico totale del backup in potenza apparente (risulta pari a 0, dato mancante?)
 # 017e 2 byte - non documentato, dai dati sembrerebbe una potenza poiché si legge 3183
-sys_total_load_watt, smart_meter_load_watt = unpack_from(">Hh", data, 0x164)
-total_pv_power, total_battery_power, total_grid_power_watt, total_grid_power_va = unpack_from(">Hhhh", data, 0x16e)
-total_inverter_power_watt, total_inverter_power_va = unpack_from(">hh", data, 0x176)
-backup_total_load_power_watt, backup_total_load_power_va, unknown_power = unpack_from(">HHh", data, 0x17a)
+(sys_total_load_watt, smart_meter_load_watt,
+ total_pv_power, total_battery_power, total_grid_power_watt, total_grid_power_va,
+ total_inverter_power_watt, total_inverter_power_va,
+ backup_total_load_power_watt, backup_total_load_power_va, unknown_power) = POWER_SUMMARY.unpack_from(data, 0x164)
 
 # A partire da 0x1a2 ci sono le statistiche per ogni elemento. Ciascun elemento ha quattro statistiche da 4 byte
 # ciascuno: totale del giorno, del mese, dell'anno, e totale globale.
@@ -136,59 +164,58 @@ backup_total_load_power_watt, backup_total_load_power_va, unknown_power = unpack
 # - Backup power consumption
 # - Energy exported to grid
 # - Energy imported from grid
-stats = []
-ENERGY_MAP = (
-      ("photovoltaic", 0x1a2),
-      ("battery charge", 0x1b2),
-      ("battery supplied", 0x1c2),
-      ("load power" ,0x1e2),
-      ("backup load", 0x1f2),
-      ("exported to grid", 0x202),
-      ("imported from grid", 0x212)
+ENERGY_NAMES = (
+      "photovoltaic",
+      "battery charge",
+      "battery supplied",
+      "load power",
+      "backup load",
+      "exported to grid",
+      "imported from grid"
 )
-for item, offset in ENERGY_MAP:
-      stat_data = unpack_from(">IIII", data, offset)
-      stat_data= (item,) + tuple(value / 100 for value in stat_data)
-      stats.append(stat_data)
-
-print("Sequence number: %08d, packet datetime: %s" % (sequence, date))
-print("Inverter type: %4x, working mode: %d" % (inverter_type, inverter_work_mode))
-print("Sample datetime: %4d-%02d-%02d %02d:%02d:%02d" % (year, month, day, hour, minute, second))
-print("Heatsink temp: %d, leakage current: %dma, iso4: %d, Reconnection time: %d" % (heatsink_temp, earth_leakage, iso4, conn_time))
-print()
-print("Grid data:")
-print("Voltage: %3.1fV\t\tCurrent: %1.3fA\t\tFrequency: %2.2fHz" % (rgrid_volt, rgrid_curr, rgrid_freq))
-print("DC current: %dma\tActive power: %dW\tApparent power: %dW\tPower factor: %3.1f" %
-      (rgrid_dci, rgrid_power_watt, rgrid_power_va, rgrid_power_pf))
-print()
-print("Inverter data:")
-print("Voltage: %3.1fV\t\tCurrent: %1.3fA\t\tFrequency: %2.2fHz" % (rinv_volt, rinv_current, rinv_freq))
-print("Active Power: %dW\tApparent Power: %dW\tPower factor: %1.3f" % (rinv_power_watt, rinv_power_va, rinv_pf))
-print("Master Bus voltage: %3.1fV\tSlave bus voltage:%3.1fV" % (bus_volt_master, bus_volt_slave))
-print()
-print("Output data:")
-print("Voltage: %3.1fV\t\tCurrent: %1.3fA\t\tFrequency: %2.2fHz" % (rout_volt, rout_curr, rout_freq))
-print("DC voltage: %dmV\tActive Power: %dW\tApparent power: %dW\tPower factor: %3.1f" % (rout_dvi, rout_power_watt, rout_power_va, rout_pf))
-print()
-print("Battery data:")
-print("Voltage: %3.1fV\t\tCurrent: %1.3fA\t\tControl Current 1: %1.3fA\tControl Current 2: %1.3fA" % (bat_volt, bat_curr, bat_curr1, bat_curr2))
-print("Power: %dW, %dVA\t\tTemperature: %3.1f °C\tCharge: %3.2f%%" % (bat_power, bat_power2, bat_tempc, bat_percent))
-print()
-print("Photovoltaic Arrays:")
-print("Array #1:\tVoltage: %3.1fV\t\tCurrent: %3.1fA\t\tPower: %dW" % (pv1_volt, pv1_curr, pv1_power))
-print("Array #2:\tVoltage: %3.1fV\t\tCurrent: %3.1fA\t\tPower: %dW" % (pv2_volt, pv2_curr, pv2_power))
-print()
-print("Current direction:")
-print("Photovoltaic: %s - Battery: %s - Grid: %s - Output: %s" % (dir_pv, dir_bat, dir_grid, dir_output))
-print()
-print("Power summary:")
-print("System total: %dW\t\tPhotovoltaic total: %dW\tBattery total: %dW\tGrid total: %dW (%dVA)" % (sys_total_load_watt, total_pv_power, total_battery_power, total_grid_power_watt, total_grid_power_va))
-print("Inverter power: %dW (%dVA)\tBackup load: %dW (%dVA)\tunkown parameter: %dW" % (total_inverter_power_watt, total_grid_power_va,
-                                                                                      backup_total_load_power_watt, backup_total_load_power_va,
-                                                                                    unknown_power))
-print("Smart meter power: %dW" % (smart_meter_load_watt,))
-
-print()
-for item in stats:
-      name, daily, monthly, yearly, total = item
-      print("%s energy\tToday: %0.2f KWh\t\tMonth: %0.2f KWh\t\tYear: %0.2f KWh\t\tTotal: %0.2f KWh" % (name, daily, monthly, yearly, total))
+energy = [value / 100 for value in ENERGY_STATS.unpack_from(data, 0x1a2)]
+stats = [(item,) + tuple(energy[index:index + 4]) for index, item in zip(range(0, 28, 4), ENERGY_NAMES)]
+
+# The report is assembled first and written out in a single call
+report = [
+      "Sequence number: %08d, packet datetime: %s" % (sequence, date),
+      "Inverter type: %4x, working mode: %d" % (inverter_type, inverter_work_mode),
+      "Sample datetime: %4d-%02d-%02d %02d:%02d:%02d" % (year, month, day, hour, minute, second),
+      "Heatsink temp: %d, leakage current: %dma, iso4: %d, Reconnection time: %d" % (heatsink_temp, earth_leakage, iso4, conn_time),
+      "",
+      "Grid data:",
+      "Voltage: %3.1fV\t\tCurrent: %1.3fA\t\tFrequency: %2.2fHz" % (rgrid_volt, rgrid_curr, rgrid_freq),
+      "DC current: %dma\tActive power: %dW\tApparent power: %dW\tPower factor: %3.1f" %
+      (rgrid_dci, rgrid_power_watt, rgrid_power_va, rgrid_power_pf),
+      "",
+      "Inverter data:",
+      "Voltage: %3.1fV\t\tCurrent: %1.3fA\t\tFrequency: %2.2fHz" % (rinv_volt, rinv_current, rinv_freq),
+      "Active Power: %dW\tApparent Power: %dW\tPower factor: %1.3f" % (rinv_power_watt, rinv_power_va, rinv_pf),
+      "Master Bus voltage: %3.1fV\tSlave bus voltage:%3.1fV" % (bus_volt_master, bus_volt_slave),
+      "",
+      "Output data:",
+      "Voltage: %3.1fV\t\tCurrent: %1.3fA\t\tFrequency: %2.2fHz" % (rout_volt, rout_curr, rout_freq),
+      "DC voltage: %dmV\tActive Power: %dW\tApparent power: %dW\tPower factor: %3.1f" % (rout_dvi, rout_power_watt, rout_power_va, rout_pf),
+      "",
+      "Battery data:",
+      "Voltage: %3.1fV\t\tCurrent: %1.3fA\t\tControl Current 1: %1.3fA\tControl Current 2: %1.3fA" % (bat_volt, bat_curr, bat_curr1, bat_curr2),
+      "Power: %dW, %dVA\t\tTemperature: %3.1f °C\tCharge: %3.2f%%" % (bat_power, bat_power2, bat_tempc, bat_percent),
+      "",
+      "Photovoltaic Arrays:",
+      "Array #1:\tVoltage: %3.1fV\t\tCurrent: %3.1fA\t\tPower: %dW" % (pv1_volt, pv1_curr, pv1_power),
+      "Array #2:\tVoltage: %3.1fV\t\tCurrent: %3.1fA\t\tPower: %dW" % (pv2_volt, pv2_curr, pv2_power),
+      "",
+      "Current direction:",
+      "Photovoltaic: %s - Battery: %s - Grid: %s - Output: %s" % (dir_pv, dir_bat, dir_grid, dir_output),
+      "",
+      "Power summary:",
+      "System total: %dW\t\tPhotovoltaic total: %dW\tBattery total: %dW\tGrid total: %dW (%dVA)" % (sys_total_load_watt, total_pv_power, total_battery_power, total_grid_power_watt, total_grid_power_va),
+      "Inverter power: %dW (%dVA)\tBackup load: %dW (%dVA)\tunkown parameter: %dW" % (total_inverter_power_watt, total_grid_power_va,
+                                                                                   backup_total_load_power_watt, backup_total_load_power_va,
+                                                                                   unknown_power),
+      "Smart meter power: %dW" % (smart_meter_load_watt,),
+      "",
+]
+report.extend("%s energy\tToday: %0.2f KWh\t\tMonth: %0.2f KWh\t\tYear: %0.2f KWh\t\tTotal: %0.2f KWh" % item for item in stats)
+
+stdout.write("\n".join(report) + "\n")
@@ -2,18 +2,27 @@
 # register writing for saj inverters through data_transmission mqtt topic
 # usage example: send_register.py <broker_ip> <serial> <register> <value>
 
-from collections import OrderedDict
-from struct import pack, unpack_from
+from struct import Struct, unpack_from
 from datetime import datetime
+from os import urandom
 from time import time
 from pymodbus.utilities import computeCRC
 from sys import argv, stderr, stdout
-import random
 import paho.mqtt.client as paho
 
 # Cannot exceed 123 registers (0x7b)
 MAX_REGISTERS_PER_REQUEST = 0x64
 
+# Precompiled structs of the MQTT packet framework
+_ID_STRUCT = Struct(">HH")
+_HEADER_STRUCT = Struct(">HBBH")
+_CONTENT_STRUCT = Struct(">BBHH")
+_CRC_STRUCT = Struct(">H")
+_LEN_STRUCT = Struct(">H")
+
+# Length prefix, header, modbus content and CRC16
+PACKET_SIZE = _LEN_STRUCT.size + _HEADER_STRUCT.size + _CONTENT_STRUCT.size + _CRC_STRUCT.size
+
 def eprint(*args, **kwargs):
     print(*args, file=stderr, **kwargs)
 
@@ -29,7 +38,8 @@ class SajMqttModbusRead(object):
         self.end = end
         self.address = address
 
-        self.responses = OrderedDict()
+        self.responses = {}
+        self.pending = 0
 
     @staticmethod
     def _forge_packet(register_start: int, register_count: int, address: int):
@@ -39,21 +49,23 @@ class SajMqttModbusRead(object):
         """
 
         # Build the modbus content part of the MQTT packet
-        content = pack(">BBHH",  address, SajMqttModbusRead.MODBUS_READ_REQUEST, register_start, register_count)
+        content = _CONTENT_STRUCT.pack(address, SajMqttModbusRead.MODBUS_READ_REQUEST, register_start, register_count)
         crc16 = computeCRC(content)
 
-        # Assemble the modbus content into the MQTT packet framework
-        req_id = int(random.random() * 65536)
-        rnd = int(random.random() * 65536)
+        # Assemble the modbus content into the MQTT packet framework, both the
+        # request id and the random field come from a single urandom() call
+        req_id, rnd = _ID_STRUCT.unpack(urandom(4))
 
-        packet = pack(">HBBH", req_id, 0x58, 0xc9, rnd) + content + pack(">H", crc16)
+        packet = bytearray(PACKET_SIZE)
+        _LEN_STRUCT.pack_into(packet, 0x0, PACKET_SIZE - _LEN_STRUCT.size)
+        _HEADER_STRUCT.pack_into(packet, 0x2, req_id, 0x58, 0xc9, rnd)
+        packet[0x8:0xe] = content
+        _CRC_STRUCT.pack_into(packet, 0xe, crc16)
 
         eprint("Request ID: %04x - CRC16: %04x - Random: %04x" % (req_id, crc16, rnd))
-        eprint("Length: %d bytes" % (len(packet),))
-
-        packet = pack(">H", len(packet)) + packet
+        eprint("Length: %d bytes" % (len(packet) - _LEN_STRUCT.size,))
 
-        return packet, req_id
+        return bytes(packet), req_id
 
     @staticmethod
     def _parse_packet(packet: bytes):
@@ -61,18 +73,19 @@ class SajMqttModbusRead(object):
 
         date = datetime.fromtimestamp(timestamp)
         size, = unpack_from(">B", packet, 0xa)
-        content = packet[0xb:0xb + size]
+        packet_view = memoryview(packet)
+        content = packet_view[0xb:0xb + size]
         crc16, = unpack_from(">H", packet, 0xb + size)
 
         # CRC is calculated starting from "request" at offset 0x3a
-        calc_crc = computeCRC(packet[0x8:0xb + size])
+        calc_crc = computeCRC(packet_view[0x8:0xb + size])
 
         eprint("Packet length: %d bytes - Request ID: %4x - Request type: %4x" % (length, req_id, request))
         eprint("Timestamp: %s" % (date,))
 
         eprint()
         eprint("Register size: %d" % (size,))
-        eprint("Register content: %s" % (":".join("%02x" % (byte,) for byte in content),))
+        eprint("Register content: %s" % (content.hex(":"),))
         eprint()
         eprint("CRC16: %x: %s" % (crc16, "ok" if crc16 == calc_crc else "bad"))
 
@@ -84,15 +97,22 @@ class SajMqttModbusRead(object):
         """
         start = self.start
         end = self.end
+        address = self.address
         responses = self.responses
+        forge_packet = self._forge_packet
+        publish = client.publish
 
         while start < end:
 
             length = min(end - start, MAX_REGISTERS_PER_REQUEST)
-            packet, req_id = self._forge_packet(start, length, self.address)
+            packet, req_id = forge_packet(start, length, address)
+
+            # A colliding request id reuses its slot, count it only if already answered
+            if responses.get(req_id, b"") is not None:
+                self.pending += 1
 
             responses[req_id] = None
-            client.publish(topic=topic, payload=packet, qos=2, retain=False)
+            publish(topic, packet, 2, False)
 
             start += length
 
@@ -103,27 +123,29 @@ class SajMqttModbusRead(object):
         """
         req_id, size, content = self._parse_packet(payload)
 
-        if req_id not in self.responses:
+        responses = self.responses
+
+        if req_id not in responses:
             return
 
-        self.responses[req_id] = content
+        if responses[req_id] is None:
+            self.pending -= 1
+
+        responses[req_id] = content
 
     def get_response(self) -> bytes|None:
         if not self.is_done():
             return None
 
-        data = bytearray()
-        for req_id, response in self.responses.items():
-            data += response
-
-        return data
+        # join() sizes the buffer once and copies each response into it
+        return bytearray().join(self.responses.values())
 
     def is_done(self):
         """
             Returns true if all the payload message have been received for the
             given MQTT registers request
         """
-        return all((response for req_id, response in self.responses.items()))
+        return self.pending == 0
 
 
 class SajMqttModbusWrite(object):
@@ -148,23 +170,25 @@ class SajMqttModbusWrite(object):
         """
 
         # Build the modbus content part of the MQTT packet
-        content = pack(">BBHH", address, SajMqttModbusWrite.MODBUS_WRITE_REQUEST, register, value)
+        content = _CONTENT_STRUCT.pack(address, SajMqttModbusWrite.MODBUS_WRITE_REQUEST, register, value)
         crc16 = computeCRC(content)
 
-        # Assemble the modbus content into the MQTT packet framework
-        req_id = int(random.random() * 65536)
-        rnd = int(random.random() * 65536)
+        # Assemble the modbus content into the MQTT packet framework, both the
+        # request id and the random field come from a single urandom() call
+        req_id, rnd = _ID_STRUCT.unpack(urandom(4))
 
-        packet = pack(">HBBH", req_id, 0x58, 0xc9, rnd) + content + pack(">H", crc16)
+        packet = bytearray(PACKET_SIZE)
+        _LEN_STRUCT.pack_into(packet, 0x0, PACKET_SIZE - _LEN_STRUCT.size)
+        _HEADER_STRUCT.pack_into(packet, 0x2, req_id, 0x58, 0xc9, rnd)
+        packet[0x8:0xe] = content
+        _CRC_STRUCT.pack_into(packet, 0xe, crc16)
 
         eprint("Request ID: %04x - CRC16: %04x - Random: %04x" % (req_id, crc16, rnd))
-        eprint("Length: %d bytes" % (len(packet),))
-
-        eprint("Request: %s" % (":".join("%02x" % (byte,) for byte in packet),))
+        eprint("Length: %d bytes" % (len(packet) - _LEN_STRUCT.size,))
 
-        packet = pack(">H", len(packet)) + packet
+        eprint("Request: %s" % (packet[_LEN_STRUCT.size:].hex(":"),))
 
-        return packet, req_id
+        return bytes(packet), req_id
 
     @staticmethod
     def _parse_packet(packet: bytes):
@@ -232,7 +256,7 @@ class SajMqttModbusWrite(object):
 def on_message(client, userdata, message, tmp=None):
 
     eprint("received message - topic: %s - qos: %d - " % (message.topic, message.qos))
-    eprint("message: %s" % (":".join("%02x" % (byte,) for byte in message.payload),))
+    eprint("message: %s" % (message.payload.hex(":"),))
 
 
     request = userdata